@@ -1,7 +1,12 @@
 """Constant definitions for SecSpy Wrapper."""
 
 DEVICE_UPDATE_INTERVAL_SECONDS = 60
+DEVICE_UPDATE_INTERVAL_STREAM_SECONDS = 300
 WEBSOCKET_CHECK_INTERVAL_SECONDS = 120
+WEBSOCKET_CONNECT_TIMEOUT_SECONDS = 1
+WEBSOCKET_MAX_RETRIES = 5
+WEBSOCKET_MAX_BACKOFF_SECONDS = 60
+WEBSOCKET_QUEUE_SIZE = 256
 
 CAMERA_MESSAGES = [
     "ARM_A",
@@ -4,6 +4,7 @@ import json
 import logging
 import time
 from collections import OrderedDict
+from xml.etree import ElementTree
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -49,7 +50,7 @@ REASON_CODES = {"128": "Human", "256": "Vehicle", "512": "Animal"}
 def process_camera(server_id, server_credential, camera, include_events):
     """Process the camera json."""
 
-    # If addtional keys are checked, update CAMERA_KEYS
+    # If addtional keys are checked, update CAMERA_KEYS and _CAMERA_FIELDS
     camera_id = camera["number"]
     # Get if camera is online
     online = camera["connected"] == "yes"
@@ -111,18 +112,21 @@ def process_camera(server_id, server_credential, camera, include_events):
     if server_id is not None:
         camera_update["server_id"] = server_id
     if include_events:
-        # Get the last time motion occured
-        if camera.get("timesincelastmotion") is not None:
-            last_update = int(time.time()) + int(camera["timesincelastmotion"])
-            camera_update["last_motion"] = datetime.datetime.fromtimestamp(
-                last_update / 1000
-            ).strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            camera_update["last_motion"] = None
+        camera_update["last_motion"] = camera_last_motion(camera)
 
     return camera_update
 
 
+def camera_last_motion(camera):
+    """Return the last time motion occured on the camera."""
+    if camera.get("timesincelastmotion") is None:
+        return None
+    last_update = int(time.time()) + int(camera["timesincelastmotion"])
+    return datetime.datetime.fromtimestamp(last_update / 1000).strftime(
+        "%Y-%m-%d %H:%M:%S"
+    )
+
+
 def camera_update_from_ws_frames(
     state_machine, server_credential, action_json, data_json
 ):
@@ -134,16 +138,19 @@ def camera_update_from_ws_frames(
     camera_id = action_json["id"]
 
     if not state_machine.has_device(camera_id):
-        _LOGGER.debug("Skipping non-adopted camera: %s", data_json)
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Skipping non-adopted camera: %s", data_json)
         return None, None
 
     camera = state_machine.update(camera_id, data_json)
 
     if data_json.keys().isdisjoint(CAMERA_KEYS):
-        _LOGGER.debug("Skipping camera data: %s", data_json)
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Skipping camera data: %s", data_json)
         return None, None
 
-    _LOGGER.debug("Processing camera: %s", camera)
+    if _LOGGER.isEnabledFor(logging.DEBUG):
+        _LOGGER.debug("Processing camera: %s", camera)
     processed_camera = process_camera(None, server_credential, camera, True)
 
     return camera_id, processed_camera
@@ -187,7 +194,8 @@ def event_from_ws_frames(state_machine, action_json, data_json):
     else:
         raise ValueError("The action must be add or update")
 
-    _LOGGER.debug("Processing event: %s", event)
+    if _LOGGER.isEnabledFor(logging.DEBUG):
+        _LOGGER.debug("Processing event: %s", event)
     processed_event = process_event(event)
 
     return device_id, processed_event
@@ -287,6 +295,92 @@ def _process_timestamp(time_stamp):
     )
 
 
+# The <camera> fields process_camera reads, the rest are not kept.
+_CAMERA_FIELDS = frozenset(
+    {
+        "number",
+        "connected",
+        "mode-a",
+        "mode-c",
+        "mode-m",
+        "width",
+        "height",
+        "ptzcapabilities",
+        "devicetype",
+        "address",
+        "name",
+        "devicename",
+        "current-fps",
+        "video-format",
+        "timesincelastmotion",
+    }
+    | {f"preset-name-{preset}" for preset in range(1, 10)}
+)
+
+
+def _camera_from_element(element):
+    """Convert a <camera> element to the dict process_camera expects."""
+    return {
+        # Match xmltodict: strip whitespace and use None for empty text.
+        child.tag: (child.text or "").strip() or None
+        for child in element
+        if child.tag in _CAMERA_FIELDS
+    }
+
+
+class SystemInfoParser:
+    """Incrementally extract the server id and cameras from systemInfo XML.
+
+    camera_callback is called with the server id and the camera dict for
+    every <camera> in the camera list as soon as it has been parsed.
+    """
+
+    def __init__(self, camera_callback):
+        """Init the parser."""
+        self._parser = ElementTree.XMLPullParser(events=("start", "end"))
+        self._path = []
+        self._in_camera = False
+        self._camera_callback = camera_callback
+        self.server_id = None
+
+    def feed(self, data):
+        """Feed a chunk of the response and process the completed elements."""
+        self._parser.feed(data)
+        self._read_events()
+
+    def close(self):
+        """Finish parsing the document."""
+        self._parser.close()
+        self._read_events()
+
+    def _read_events(self):
+        path = self._path
+        for event, element in self._parser.read_events():
+            if event == "start":
+                if path and element.tag == "camera" and path[-1].tag == "cameralist":
+                    self._in_camera = True
+                path.append(element)
+                continue
+            path.pop()
+            if not path:
+                continue
+            if self._in_camera:
+                if element.tag != "camera":
+                    continue
+                self._in_camera = False
+                path[-1].remove(element)
+                self._camera_callback(
+                    self.server_id, _camera_from_element(element)
+                )
+                continue
+            parent = path[-1]
+            if element.tag == "uuid" and parent.tag == "server":
+                self.server_id = (element.text or "").strip() or None
+            # Nothing outside the cameras is needed after this point, drop
+            # schedules, presets and the like as soon as they are parsed.
+            parent.remove(element)
+
+
 class SecspyDeviceStateMachine:
     """A simple state machine for events."""
 
@@ -1,32 +1,43 @@
 """Module to communicate with the SecuritySpy API."""
 import asyncio
-import json as pjson
+import functools
+import itertools
 import logging
+import random
+import re
+import sys
 import time
 from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 import aiohttp
 import xmltodict
 from aiohttp import client_exceptions
+from yarl import URL
 
 from pysecspy.const import (
-    CAMERA_MESSAGES,
     DEVICE_UPDATE_INTERVAL_SECONDS,
-    EVENT_MESSAGES,
+    DEVICE_UPDATE_INTERVAL_STREAM_SECONDS,
     RECORDING_TYPE_ACTION,
     RECORDING_TYPE_CONTINUOUS,
     RECORDING_TYPE_MOTION,
     SERVER_ID,
     SERVER_NAME,
     WEBSOCKET_CHECK_INTERVAL_SECONDS,
+    WEBSOCKET_CONNECT_TIMEOUT_SECONDS,
+    WEBSOCKET_MAX_BACKOFF_SECONDS,
+    WEBSOCKET_MAX_RETRIES,
+    WEBSOCKET_QUEUE_SIZE,
 )
 from pysecspy.errors import RequestError
 from pysecspy.secspy_data import (
     PROCESSED_EVENT_EMPTY,
     SecspyDeviceStateMachine,
     SecspyEventStateMachine,
+    SystemInfoParser,
     camera_event_from_ws_frames,
+    camera_last_motion,
     camera_update_from_ws_frames,
     event_from_ws_frames,
     process_camera,
@@ -37,6 +48,57 @@ DEFAULT_SNAPSHOT_HEIGHT = 1080
 
 _LOGGER = logging.getLogger(__name__)
 
+_XML_CHUNK_SIZE = 32768
+# Plain dicts, older xmltodict releases default to OrderedDict.
+_parse_xml_dict = functools.partial(xmltodict.parse, dict_constructor=dict)
+_EVENT_LINE = re.compile(rb"\d{14} ")
+
+# The longest message read is CLASSIFY, which uses the first ten fields:
+# 20220828102950 69 0 CLASSIFY HUMAN 2 VEHICLE 1 ANIMAL 0
+_WS_MAX_SPLIT = 10
+
+_REASON_HUMAN = "128"
+_REASON_VEHICLE = "256"
+_REASON_ANIMAL = "512"
+
+_CAMERA_ACTIONS = {
+    "ARM_A": {"recordingSettings_A": True},
+    "ARM_C": {"recordingSettings_C": True},
+    "ARM_M": {"recordingSettings_M": True},
+    "DISARM_A": {"recordingSettings_A": False},
+    "DISARM_C": {"recordingSettings_C": False},
+    "DISARM_M": {"recordingSettings_M": False},
+}
+_EAGER_TASK_FACTORY = getattr(asyncio, "eager_task_factory", None)
+
+_ARM_MODES = {
+    RECORDING_TYPE_ACTION: ("A", "recording_mode_a"),
+    RECORDING_TYPE_MOTION: ("M", "recording_mode_m"),
+    RECORDING_TYPE_CONTINUOUS: ("C", "recording_mode_c"),
+}
+
+
+def _log_subscriber_errors(future):
+    """Log exceptions raised by async subscribers."""
+    if future.cancelled():
+        return
+    for result in future.result():
+        if isinstance(result, Exception):
+            _LOGGER.error("Error in event subscriber: %s", result)
+
+
+def _create_task(coro):
+    """Create a task, starting it eagerly on Python 3.12+.
+
+    The task runs up to its first suspension right away instead of waiting
+    for the next loop iteration. The loop-wide task factory is left alone,
+    it belongs to the application.
+    """
+    loop = asyncio.get_running_loop()
+    if _EAGER_TASK_FACTORY is not None:
+        return _EAGER_TASK_FACTORY(loop, coro)
+    return loop.create_task(coro)
+
 
 class SecSpyServer:
     """Updates device states and attributes."""
@@ -63,11 +125,31 @@ class SecSpyServer:
             f"https://{host}:{port}" if self._use_ssl else f"http://{host}:{port}"
         )
         self._token = b64encode(
-            bytes(f"{self._username}:{self._password}", "utf-8")
-        ).decode()
-        self.headers = {"Content-Type": "text/xml"}
-        self._last_device_update_time = 0
-        self._last_websocket_check = 0
+            f"{self._username}:{self._password}".encode()
+        ).decode("ascii")
+        # Parse the endpoint URLs once, aiohttp uses a yarl.URL as given.
+        base_url = URL(self._base_url)
+        self._system_uri = base_url / "systemInfo"
+        self._image_uri = base_url / "image"
+        self._download_uri = base_url / "download"
+        self._schedule_uri = base_url / "setSchedule"
+        self._preset_uri = base_url / "setPreset"
+        self._ptz_uri = base_url / "ptz/command"
+        self._camera_settings_uri = base_url / "camerasettings"
+        self._stream_uri = (base_url / "eventStream").with_query(
+            {"version": 3, "format": "multipart"}
+        )
+        self._stream_timeout = aiohttp.ClientTimeout(
+            total=None, connect=None, sock_connect=None, sock_read=None
+        )
+        # Keep a wedged NVR from stalling update() and the other calls.
+        self._timeout = aiohttp.ClientTimeout(total=10, sock_connect=3, sock_read=10)
+        # Recordings can take a while to download, only time out on stalls.
+        self._download_timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=3, sock_read=10
+        )
+        self._last_device_update = float("-inf")
+        self._next_ws_check = 0.0
         self._device_state_machine = SecspyDeviceStateMachine()
         self._event_state_machine = SecspyEventStateMachine()
         self.server_credential = {
@@ -77,20 +159,44 @@ class SecSpyServer:
         }
 
         self._processed_data = {}
+        self._camera_signatures = {}
+        self._server_id = None
+        # One worker keeps XML parses serialized and away from the default
+        # executor shared with the rest of the application.
+        self._xml_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="pysecspy-xml"
+        )
         self.last_update_id = None
 
         self.req = session
-        self.headers = None
-        self.ws_session = None
+        # Send the token as Basic auth rather than an auth query parameter,
+        # the request URLs then stay fixed and do not carry credentials.
+        self.headers = {"Authorization": f"Basic {self._token}"}
         self.ws_connection = None
         self.ws_task = None
-        self._ws_subscriptions = []
+        self._ws_tasks = set()
+        self._event_queue = None
+        self._ws_connected = None
+        self._ws_subscriptions = {}
+        self._ws_subscription_ids = itertools.count()
+        self._ws_subscribers = ()
+        self._pending_updates = {}
+        self._flush_scheduled = False
         self._is_first_update = True
         self._signal_stop = False
         self.global_event_score_human = 0
         self.global_event_score_vehicle = 0
         self.global_event_score_animal = 0
         self.global_event_object = None
+        self._ws_builders = {
+            **{action_key: self._build_camera_action for action_key in _CAMERA_ACTIONS},
+            "ONLINE": self._build_online_event,
+            "OFFLINE": self._build_online_event,
+            "TRIGGER_M": self._build_motion_event,
+            "MOTION": self._build_motion_event,
+            "MOTION_END": self._build_motion_end_event,
+            "CLASSIFY": self._build_classify_event,
+        }
 
     @property
     def devices(self):
@@ -100,28 +206,39 @@ class SecSpyServer:
     async def update(self, force_camera_update=False) -> dict:
         """Updates the status of devices."""
 
-        current_time = time.time()
+        now = time.monotonic()
         device_update = False
-        if (
-            force_camera_update
-            or (current_time - DEVICE_UPDATE_INTERVAL_SECONDS)
-            > self._last_device_update_time
-        ):
+        # The event stream keeps motion and arming current, but names, online
+        # state and the like only come from systemInfo, so keep polling it at
+        # a slower pace while the stream is connected.
+        if self.ws_connection is None:
+            interval = DEVICE_UPDATE_INTERVAL_SECONDS
+        else:
+            interval = DEVICE_UPDATE_INTERVAL_STREAM_SECONDS
+        if force_camera_update or now >= self._last_device_update + interval:
             _LOGGER.debug("Doing device update")
             device_update = True
             await self._get_device_list(not self.ws_connection)
-            self._last_device_update_time = current_time
+            self._last_device_update = now
         else:
             _LOGGER.debug("Skipping device update")
 
-        if (
-            current_time - WEBSOCKET_CHECK_INTERVAL_SECONDS
-        ) > self._last_websocket_check:
+        ws_checked = False
+        if self.ws_connection is None and now >= self._next_ws_check:
             _LOGGER.debug("Checking websocket")
-            self._last_websocket_check = current_time
+            ws_checked = True
+            self._next_ws_check = now + WEBSOCKET_CHECK_INTERVAL_SECONDS
             await self.async_connect_ws()
+            # Give the stream a moment to connect, so ws_connection reflects
+            # the new connection rather than the state before the check.
+            try:
+                await asyncio.wait_for(
+                    self._ws_connected.wait(), WEBSOCKET_CONNECT_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                _LOGGER.debug("Event stream is not connected yet")
 
-        if self.ws_connection or self._last_websocket_check == current_time:
+        if self.ws_connection or ws_checked:
             _LOGGER.debug("Skipping update since websocket is active.")
             return self._processed_data if device_update else {}
 
@@ -130,62 +247,94 @@ class SecSpyServer:
         if self.ws_connection is not None:
             return
 
-        if self.ws_task is not None:
-            try:
-                self.ws_task.cancel()
-                self.ws_connection = None
-            except Exception:
-                _LOGGER.exception("Could not cancel ws_task")
-        self.ws_task = asyncio.ensure_future(self._setup_streamreader())
+        await self._cancel_ws_task()
+        if self._ws_connected is None:
+            self._ws_connected = asyncio.Event()
+        self.ws_task = _create_task(self._setup_streamreader())
+        self._ws_tasks.add(self.ws_task)
+        self.ws_task.add_done_callback(self._ws_tasks.discard)
 
     async def async_disconnect_ws(self):
         """Disconnect the websocket."""
+        # Stop the reader first, otherwise it treats the closed stream as a
+        # dropped connection and reconnects.
+        await self._cancel_ws_task()
+        self._close_stream()
+
+    async def _cancel_ws_task(self):
+        """Cancel the stream reader task and wait for it to finish."""
+        if self.ws_task is None or self.ws_task.done():
+            return
+        self.ws_task.cancel()
+        try:
+            await self.ws_task
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            _LOGGER.exception("Could not cancel ws_task")
+
+    def _close_stream(self):
+        """Close the stream response, the session belongs to the caller."""
         if self.ws_connection is None:
             return
-
-        await self.ws_connection.wait_for_close()
-        await self.ws_session.close()
+        self.ws_connection.close()
+        self.ws_connection = None
 
     async def _get_device_list(self, include_events) -> None:
         """Get a list of devices connected to the NVR."""
 
-        system_uri = f"{self._base_url}/systemInfo?auth={self._token}"
-        response = await self.req.get(
-            system_uri,
-            headers=self.headers,
-            ssl=False,
+        # Process each camera as it arrives instead of building a tree for
+        # the whole systemInfo document.
+        first_update = self._is_first_update
+        include = include_events or first_update
+        process = self._process_camera
+        parser = SystemInfoParser(
+            lambda server_id, camera: process(server_id, camera, include, first_update)
         )
-        if response.status != 200:
-            raise RequestError(
-                f"Fetching Camera List failed: {response.status} - Reason: {response.reason}"
-            )
-        data = await response.read()
-        json_raw = xmltodict.parse(data)
-        json_response = pjson.loads(pjson.dumps(json_raw))
-        server_id = json_response["system"]["server"]["uuid"]
-
-        self._process_cameras_json(json_response, server_id, include_events)
-
+        # The body is not read in one go, so release the connection
+        # explicitly when parsing or processing a camera fails.
+        try:
+            async with self.req.get(
+                self._system_uri,
+                headers=self.headers,
+                timeout=self._timeout,
+                ssl=False,
+            ) as response:
+                if response.status != 200:
+                    raise RequestError(
+                        f"Fetching Camera List failed: {response.status} - Reason: {response.reason}"
+                    )
+                async for chunk in response.content.iter_chunked(_XML_CHUNK_SIZE):
+                    parser.feed(chunk)
+        except (client_exceptions.ClientError, asyncio.TimeoutError) as err:
+            raise RequestError(f"Fetching Camera List failed: {err!r}") from err
+        parser.close()
+
+        if parser.server_id is not None:
+            self._server_id = parser.server_id
         self._is_first_update = False
 
     async def _get_server_information(self) -> None:
         """Return information about the SecuritySpy Server."""
 
-        system_uri = f"{self._base_url}/systemInfo?auth={self._token}"
-        response = await self.req.get(
-            system_uri,
-            headers=self.headers,
-            ssl=False,
-        )
-        if response.status != 200:
-            raise RequestError(
-                f"Fetching Server Information failed: {response.status} - Reason: {response.reason}"
+        try:
+            response = await self.req.get(
+                self._system_uri,
+                headers=self.headers,
+                timeout=self._timeout,
+                ssl=False,
             )
-
-        data = await response.read()
-        json_raw = xmltodict.parse(data)
-        json_response = pjson.loads(pjson.dumps(json_raw))
+            if response.status != 200:
+                raise RequestError(
+                    f"Fetching Server Information failed: {response.status} - Reason: {response.reason}"
+                )
+            data = await response.read()
+        except (client_exceptions.ClientError, asyncio.TimeoutError) as err:
+            raise RequestError(f"Fetching Server Information failed: {err!r}") from err
+
+        json_response = await self._parse_xml(data)
         nvr = json_response["system"]["server"]
+        self._server_id = nvr["uuid"]
         sys_info = json_response["system"]
         sched_preset = sys_info.get("schedulepresetlist")
         presets = []
@@ -205,7 +354,9 @@ class SecSpyServer:
     async def get_unique_id(self) -> None:
         """Get a Unique ID for this NVR."""
 
-        return await self._get_server_information()[SERVER_ID]
+        if self._server_id is None:
+            await self._get_server_information()
+        return self._server_id
 
     async def get_server_information(self):
         """Returns a Server Information for this NVR."""
@@ -216,84 +367,105 @@ class SecSpyServer:
         image_width = width or DEFAULT_SNAPSHOT_WIDTH
         image_height = height or DEFAULT_SNAPSHOT_HEIGHT
 
-        image_uri = f"{self._base_url}/image?cameraNum={camera_id}&width={image_width}&height={image_height}&quality=75&auth={self._token}"
-
-        response = await self.req.get(
-            image_uri,
-            headers=self.headers,
-            ssl=False,
-        )
-        if response.status != 200:
-            raise RequestError(
-                f"Fetching Snapshot Image failed: {response.status} - Reason: {response.reason}"
+        try:
+            response = await self.req.get(
+                self._image_uri,
+                params={
+                    "cameraNum": camera_id,
+                    "width": image_width,
+                    "height": image_height,
+                    "quality": 75,
+                },
+                headers=self.headers,
+                timeout=self._timeout,
+                ssl=False,
             )
-        return await response.read()
+            if response.status != 200:
+                raise RequestError(
+                    f"Fetching Snapshot Image failed: {response.status} - Reason: {response.reason}"
+                )
+            return await response.read()
+        except (client_exceptions.ClientError, asyncio.TimeoutError) as err:
+            raise RequestError(f"Fetching Snapshot Image failed: {err!r}") from err
 
     async def get_latest_motion_recording(self, camera_id: str) -> bytes:
         """ Returns the latest motion recording file. """
 
         # Get the latest file name
-        file_uri = f"{self._base_url}/download?cameraNum={camera_id}&mcFilesCheck=1&ageText=1&results=1&format=xml&auth={self._token}"
-        response = await self.req.get(
-            file_uri,
-            headers=self.headers,
-            ssl=False,
-        )
-        if response.status != 200:
-            raise RequestError(
-                f"Fetching Recording files failed: {response.status} - Reason: {response.reason}"
+        try:
+            response = await self.req.get(
+                self._download_uri,
+                params={
+                    "cameraNum": camera_id,
+                    "mcFilesCheck": 1,
+                    "ageText": 1,
+                    "results": 1,
+                    "format": "xml",
+                },
+                headers=self.headers,
+                timeout=self._timeout,
+                ssl=False,
             )
-        json_raw = xmltodict.parse(await response.read())
-        json_response = pjson.loads(pjson.dumps(json_raw))
+            if response.status != 200:
+                raise RequestError(
+                    f"Fetching Recording files failed: {response.status} - Reason: {response.reason}"
+                )
+            data = await response.read()
+        except (client_exceptions.ClientError, asyncio.TimeoutError) as err:
+            raise RequestError(f"Fetching Recording files failed: {err!r}") from err
+        json_response = await self._parse_xml(data)
         download_url = json_response["feed"]["entry"]["link"]["@href"]
 
         # Retrieve the file
-        video_uri = f"{self._base_url}/{download_url}?auth={self._token}"
+        video_uri = f"{self._base_url}/{download_url}"
         _LOGGER.debug("VIDEO URI: %s", video_uri)
 
-        response = await self.req.get(
-            video_uri,
-            headers=self.headers,
-            ssl=False,
-        )
-        if response.status != 200:
-            raise RequestError(
-                f"Fetching Video Recording failed: {response.status} - Reason: {response.reason}"
+        try:
+            response = await self.req.get(
+                video_uri,
+                headers=self.headers,
+                timeout=self._download_timeout,
+                ssl=False,
             )
-        return await response.read()
+            if response.status != 200:
+                raise RequestError(
+                    f"Fetching Video Recording failed: {response.status} - Reason: {response.reason}"
+                )
+            return await response.read()
+        except (client_exceptions.ClientError, asyncio.TimeoutError) as err:
+            raise RequestError(f"Fetching Video Recording failed: {err!r}") from err
 
     async def set_arm_mode(self, camera_id: str, mode: str, enabled: bool) -> bool:
         """Sets the camera arming mode .
         Valid inputs for mode: action, on_motion, continuous. Valid input for value is True or False
         """
 
-        schedule = 1 if enabled else 0
-
-        if mode in RECORDING_TYPE_ACTION:
-            rec_mode = "A"
-            json_id = "recording_mode_a"
-
-        if mode in RECORDING_TYPE_MOTION:
-            rec_mode = "M"
-            json_id = "recording_mode_m"
+        if mode not in _ARM_MODES:
+            raise ValueError(f"Invalid arming mode: {mode}")
+        rec_mode, json_id = _ARM_MODES[mode]
 
-        if mode in RECORDING_TYPE_CONTINUOUS:
-            rec_mode = "C"
-            json_id = "recording_mode_c"
-
-        cam_uri = f"{self._base_url}/setSchedule?cameraNum={camera_id}&schedule={schedule}&override=0&mode={rec_mode}&auth={self._token}"
-
-        response = await self.req.get(
-            cam_uri,
-            headers=self.headers,
-            ssl=False,
-        )
-        if response.status != 200:
-            raise RequestError(
-                f"Setting Arming mode failed: {response.status} - Reason: {response.reason}"
+        try:
+            response = await self.req.get(
+                self._schedule_uri,
+                params={
+                    "cameraNum": camera_id,
+                    "schedule": 1 if enabled else 0,
+                    "override": 0,
+                    "mode": rec_mode,
+                },
+                headers=self.headers,
+                timeout=self._timeout,
+                ssl=False,
             )
+            if response.status != 200:
+                raise RequestError(
+                    f"Setting Arming mode failed: {response.status} - Reason: {response.reason}"
+                )
+        except (client_exceptions.ClientError, asyncio.TimeoutError) as err:
+            raise RequestError(f"Setting Arming mode failed: {err!r}") from err
 
         self._processed_data[camera_id][json_id] = enabled
+        self._camera_signatures.pop(camera_id, None)
         return True
 
     async def enable_schedule_preset(self, schedule_id: str) -> bool:
@@ -302,33 +474,43 @@ class SecSpyServer:
         Format: setPreset?id=X
         """
 
-        cam_uri = f"{self._base_url}/setPreset?id={schedule_id}&auth={self._token}"
-
-        response = await self.req.get(
-            cam_uri,
-            headers=self.headers,
-            ssl=False,
-        )
-        if response.status != 200:
-            raise RequestError(
-                f"Setting Schedule Preset failed: {response.status} - Reason: {response.reason}"
+        try:
+            response = await self.req.get(
+                self._preset_uri,
+                params={"id": schedule_id},
+                headers=self.headers,
+                timeout=self._timeout,
+                ssl=False,
             )
+            if response.status != 200:
+                raise RequestError(
+                    f"Setting Schedule Preset failed: {response.status} - Reason: {response.reason}"
+                )
+        except (client_exceptions.ClientError, asyncio.TimeoutError) as err:
+            raise RequestError(f"Setting Schedule Preset failed: {err!r}") from err
 
         return True
 
     async def set_ptz_preset(self, camera_id: str, preset_id: str, speed: int=50) -> bool:
         """Set a PTZ Preset."""
-        cam_uri = f"{self._base_url}/ptz/command?cameraNum={camera_id}&command={preset_id}&speed={speed}&auth={self._token}"
-
-        response = await self.req.get(
-            cam_uri,
-            headers=self.headers,
-            ssl=False,
-        )
-        if response.status != 200:
-            raise RequestError(
-                f"Setting PTZ Preset failed: {response.status} - Reason: {response.reason}"
+        try:
+            response = await self.req.get(
+                self._ptz_uri,
+                params={
+                    "cameraNum": camera_id,
+                    "command": preset_id,
+                    "speed": speed,
+                },
+                headers=self.headers,
+                timeout=self._timeout,
+                ssl=False,
             )
+            if response.status != 200:
+                raise RequestError(
+                    f"Setting PTZ Preset failed: {response.status} - Reason: {response.reason}"
+                )
+        except (client_exceptions.ClientError, asyncio.TimeoutError) as err:
+            raise RequestError(f"Setting PTZ Preset failed: {err!r}") from err
 
         return True
 
@@ -339,99 +521,154 @@ class SecSpyServer:
 
         _enable = 1 if enabled else 0
 
-        cam_uri = f"{self._base_url}/camerasettings?auth={self._token}"
         data = f"cameraNum={camera_id}&camEnabledCheck={_enable}&action=save"
 
-        response = await self.req.post(
-            cam_uri,
-            headers=self.headers,
-            data=data,
-            ssl=False,
-        )
-        if response.status != 200:
-            raise RequestError(
-                f"Enable/Disable camera failed: {response.status} - Reason: {response.reason}"
+        try:
+            response = await self.req.post(
+                self._camera_settings_uri,
+                headers=self.headers,
+                data=data,
+                timeout=self._timeout,
+                ssl=False,
             )
+            if response.status != 200:
+                raise RequestError(
+                    f"Enable/Disable camera failed: {response.status} - Reason: {response.reason}"
+                )
+        except (client_exceptions.ClientError, asyncio.TimeoutError) as err:
+            raise RequestError(f"Enable/Disable camera failed: {err!r}") from err
 
         self._processed_data[camera_id]["enabled"] = enabled
+        self._camera_signatures.pop(camera_id, None)
         return True
 
-    def _process_cameras_json(self, json_response, server_id, include_events):
-        items = json_response["system"]["cameralist"]["camera"]
-        cameras = []
-        if not isinstance(
-            items,
-            (
-                frozenset,
-                list,
-                set,
-                tuple,
-            ),
-        ):
-            cameras.append(items)
-        else:
-            cameras = items
-
-        for camera in cameras:
-            camera_id = camera["number"]
-            _LOGGER.debug("Processing Camera %s", camera_id)
-            if self._is_first_update:
-                self._update_device(camera_id, PROCESSED_EVENT_EMPTY)
-                camera["enabled"] = True
-            self._device_state_machine.update(camera_id, camera)
-            self._update_device(
-                camera_id,
-                process_camera(
-                    server_id,
-                    self.server_credential,
-                    camera,
-                    include_events or self._is_first_update,
-                ),
-            )
+    async def _parse_xml(self, data):
+        """Parse an XML response in an executor to keep the event loop free."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._xml_executor, _parse_xml_dict, data
+        )
+
+    def _process_camera(self, server_id, camera, include, first_update):
+        """Process a single camera from the systemInfo response."""
+        # Every poll parses a new copy of the number, interned it matches
+        # the stored device dict keys by identity.
+        camera_id = camera["number"] = sys.intern(camera["number"])
+        _LOGGER.debug("Processing Camera %s", camera_id)
+        if first_update:
+            self._update_device(camera_id, PROCESSED_EVENT_EMPTY)
+            camera["enabled"] = True
+        self._device_state_machine.update(camera_id, camera)
+        # Skip processing when the camera XML has not changed since the
+        # last poll, the processed data would be identical. The time since
+        # the last motion changes on every poll, so it is left out and
+        # last_motion is refreshed on its own.
+        fields = tuple(item for item in camera.items() if item[0] != "timesincelastmotion")
+        signature = (include, server_id, fields)
+        if self._camera_signatures.get(camera_id) == signature:
+            if include:
+                self._processed_data[camera_id]["last_motion"] = camera_last_motion(camera)
+            return
+        self._update_device(
+            camera_id,
+            process_camera(server_id, self.server_credential, camera, include),
+        )
+        # Only remember the camera once it was processed, a failed camera is
+        # processed again on the next poll.
+        self._camera_signatures[camera_id] = signature
 
     def _update_device(self, device_id, processed_update):
         """Update internal state of a device."""
-        self._processed_data.setdefault(device_id, {}).update(processed_update)
+        device = self._processed_data.get(device_id)
+        if device is None:
+            device = self._processed_data[device_id] = {}
+        device.update(processed_update)
 
     def _reset_device_events(self) -> None:
         """Reset device events between device updates."""
-        for device_id in self._processed_data:
-            self._update_device(device_id, PROCESSED_EVENT_EMPTY)
+        for device in self._processed_data.values():
+            device.update(PROCESSED_EVENT_EMPTY)
 
     async def _setup_streamreader(self):
         """Setup the Event Websocket."""
-        url = f"{self._base_url}/eventStream?version=3&format=multipart&auth={self._token}"
-        timeout = aiohttp.ClientTimeout(
-            total=None, connect=None, sock_connect=None, sock_read=None
-        )
-        if not self.ws_session:
-            self.ws_session = aiohttp.ClientSession(timeout=timeout)
-        _LOGGER.debug("Receiving from: %s", url)
-
-        self.ws_connection = await self.ws_session.request("get", url)
+        self._event_queue = asyncio.Queue(maxsize=WEBSOCKET_QUEUE_SIZE)
+        consumer = _create_task(self._consume_stream_messages())
+        failures = 0
         try:
-            async for msg in self.ws_connection.content:
-                if self.ws_connection.closed:
-                    break
-                data = msg.decode("UTF-8").strip()
-                if data[:14].isnumeric():
-                    try:
-                        self._process_ws_message(data)
-                    except Exception as err:
-                        _LOGGER.exception(
-                            "Error processing stream message. Error: %s", err
-                        )
-                        return
-                await asyncio.sleep(0)
-        except client_exceptions.ClientConnectionError:
-            return
-        except Exception as ed:
-            _LOGGER.debug("Unhandled error: %s", ed)
-            return
+            while True:
+                try:
+                    received = await self._read_event_stream()
+                except Exception as ed:
+                    _LOGGER.debug("Unhandled error: %s", ed)
+                    return
+
+                # Only count connections that never delivered an event, so a
+                # long running stream that drops starts over with a short wait.
+                failures = 0 if received else failures + 1
+                if failures >= WEBSOCKET_MAX_RETRIES:
+                    _LOGGER.debug("Event stream failed %s times, giving up", failures)
+                    return
+                delay = min(2**failures + random.random(), WEBSOCKET_MAX_BACKOFF_SECONDS)
+                _LOGGER.debug("Reconnecting event stream in %.1f seconds", delay)
+                await asyncio.sleep(delay)
         finally:
-            _LOGGER.debug("stream disconnected")
-            await self.async_disconnect_ws()
-            self.ws_connection = None
+            consumer.cancel()
+
+    async def _read_event_stream(self) -> bool:
+        """Read the event stream until it disconnects.
+
+        Returns True if at least one event was received, also when the
+        connection was dropped with an error afterwards.
+        """
+        _LOGGER.debug("Receiving from: %s", self._stream_uri)
+
+        received = False
+        try:
+            response = self.ws_connection = await self.req.request(
+                "get",
+                self._stream_uri,
+                headers=self.headers,
+                timeout=self._stream_timeout,
+            )
+            self._ws_connected.set()
+            try:
+                # Hold on to the response, ws_connection is cleared when the
+                # stream is closed while this loop may still be running.
+                async for msg in response.content:
+                    if response.closed:
+                        break
+                    # Event lines start with a 14 digit timestamp, skip boundary
+                    # markers and part headers without decoding them.
+                    if not _EVENT_LINE.match(msg):
+                        continue
+                    received = True
+                    # The fields read from a line are ASCII, latin-1 decodes
+                    # without validating the rest (like non-ASCII FILE paths).
+                    self._queue_stream_message(msg.decode("latin-1").strip())
+            finally:
+                _LOGGER.debug("stream disconnected")
+                self._ws_connected.clear()
+                self._close_stream()
+        except (client_exceptions.ClientError, asyncio.TimeoutError) as err:
+            # A dropped stream shows up as a connection or a payload error.
+            _LOGGER.debug("Event stream connection error: %s", err)
+        return received
+
+    def _queue_stream_message(self, msg):
+        """Queue a stream message, dropping the oldest one if the queue is full."""
+        if self._event_queue.full():
+            dropped = self._event_queue.get_nowait()
+            # A dropped MOTION_END leaves event_on set until the next event.
+            _LOGGER.warning("Event stream queue is full, dropping: %s", dropped)
+        self._event_queue.put_nowait(msg)
+
+    async def _consume_stream_messages(self):
+        """Process queued stream messages."""
+        while True:
+            msg = await self._event_queue.get()
+            try:
+                self._process_ws_message(msg)
+            except Exception as err:
+                _LOGGER.exception("Error processing stream message. Error: %s", err)
 
     def subscribe_websocket(self, ws_callback):
         """Subscribe to websocket events.
@@ -439,214 +676,142 @@ class SecSpyServer:
         Returns a callback that will unsubscribe.
         """
 
+        # Key by a counter so the same callable can subscribe more than once.
+        key = next(self._ws_subscription_ids)
+
         def _unsub_ws_callback():
-            self._ws_subscriptions.remove(ws_callback)
+            if self._ws_subscriptions.pop(key, None) is not None:
+                self._ws_subscribers = tuple(self._ws_subscriptions.values())
 
         _LOGGER.debug("Adding subscription: %s", ws_callback)
-        self._ws_subscriptions.append(ws_callback)
+        self._ws_subscriptions[key] = ws_callback
+        self._ws_subscribers = tuple(self._ws_subscriptions.values())
         return _unsub_ws_callback
 
     def _process_ws_message(self, msg):
         """Process websocket messages."""
 
-        # pylint: disable=too-many-branches
         # _LOGGER.debug("MSG: %s", msg)
 
-        action_array = msg.split(" ")
+        action_array = msg.split(" ", _WS_MAX_SPLIT)
         action_key = action_array[3]
-        model_key = None
-        if action_key in CAMERA_MESSAGES:
-            model_key = "camera"
-        if action_key in EVENT_MESSAGES:
-            model_key = "event"
-
-        if model_key not in ("event", "camera"):
+        builder = self._ws_builders.get(action_key)
+        if builder is None:
             return
 
-        action_json = {}
-        data_json = {}
-
+        model_key, action_json, data_json = builder(action_array)
         if model_key == "camera":
-            action_json = {
-                "modelKey": "camera",
-                "id": action_array[2],
-            }
-            if action_key == "ARM_A":
-                data_json = {
-                    "recordingSettings_A": True,
-                }
-            if action_key == "ARM_C":
-                data_json = {
-                    "recordingSettings_C": True,
-                }
-            if action_key == "ARM_M":
-                data_json = {
-                    "recordingSettings_M": True,
-                }
-            if action_key == "DISARM_A":
-                data_json = {
-                    "recordingSettings_A": False,
-                }
-            if action_key == "DISARM_C":
-                data_json = {
-                    "recordingSettings_C": False,
-                }
-            if action_key == "DISARM_M":
-                data_json = {
-                    "recordingSettings_M": False,
-                }
-            # if action_key == "ONLINE":
-            #     data_json = {
-            #         "online": True,
-            #     }
-            # if action_key == "OFFLINE":
-            #     data_json = {
-            #         "online": False,
-            #     }
-
             self._process_camera_ws_message(action_json, data_json)
-            return
-
-        if model_key == "event":
-            if action_key == "ONLINE":
-                data_json = {
-                    "type": "online",
-                    "camera": action_array[2],
-                    "isOnline": True,
-                }
-                action_json = {
-                    "modelKey": "event",
-                    "action": "add",
-                    "id": action_array[2],
-                }
-            if action_key == "OFFLINE":
-                data_json = {
-                    "type": "online",
-                    "camera": action_array[2],
-                    "isOnline": False,
-                }
-                action_json = {
-                    "modelKey": "event",
-                    "action": "add",
-                    "id": action_array[2],
-                }
-
-            if action_key == "TRIGGER_M":
-                self.global_event_object = action_array[4]
-                data_json = {
-                    "type": "motion",
-                    "start": action_array[0],
-                    "camera": action_array[2],
-                    "reason": self.global_event_object,
-                    "event_score_human": self.global_event_score_human,
-                    "event_score_vehicle": self.global_event_score_vehicle,
-                    "isMotionDetected": True,
-                    "isOnline": True,
-                }
-                action_json = {
-                    "modelKey": "event",
-                    "action": "add",
-                    "id": action_array[2],
-                }
-
-            if action_key == "MOTION":
-                data_json = {
-                    "type": "motion",
-                    "start": action_array[0],
-                    "camera": action_array[2],
-                    "reason": self.global_event_object,
-                    "event_score_human": self.global_event_score_human,
-                    "event_score_vehicle": self.global_event_score_vehicle,
-                    "isMotionDetected": True,
-                    "isOnline": True,
-                }
-                action_json = {
-                    "modelKey": "event",
-                    "action": "add",
-                    "id": action_array[2],
-                }
-
-            if action_key == "MOTION_END":
-                self.global_event_score_human = 0
-                self.global_event_score_vehicle = 0
-                self.global_event_object = None
-                data_json = {
-                    "type": "motion",
-                    "end": action_array[0],
-                    "camera": action_array[2],
-                    "isMotionDetected": False,
-                    "reason": self.global_event_object,
-                    "event_score_human": self.global_event_score_human,
-                    "event_score_vehicle": self.global_event_score_vehicle,
-                    "isOnline": True,
-                }
-                action_json = {
-                    "modelKey": "event",
-                    "action": "update",
-                    "id": action_array[2],
-                }
-
-            if action_key == "CLASSIFY":
-                # Format: 20220828102950 69 0 CLASSIFY HUMAN 2 VEHICLE 1 ANIMAL 0
-                _LOGGER.debug("CLASSIFY: %s", action_array)
-                # Need to put this is, as animal reuires SS V5.5
-                try:
-                    self.global_event_score_human = action_array[5]
-                    self.global_event_score_vehicle = action_array[7]
-                    self.global_event_score_animal = action_array[9]
-                    self.global_event_object = None
-                except:
-                    self.global_event_score_animal = 0
-                finally:
-                    # Set the Event Object to the highest score
-                    if (self.global_event_score_human > self.global_event_score_vehicle) and (self.global_event_score_human > self.global_event_score_animal):
-                        self.global_event_object = "128"
-                    if (self.global_event_score_vehicle > self.global_event_score_human) and (self.global_event_score_vehicle > self.global_event_score_animal):
-                        self.global_event_object = "256"
-                    if (self.global_event_score_animal > self.global_event_score_human) and (self.global_event_score_animal > self.global_event_score_vehicle):
-                        self.global_event_object = "512"
-
-                # if len(action_array) > 6:
-                #     self.global_event_score_human = action_array[5]
-                #     self.global_event_score_vehicle = action_array[7]
-                #     if self.global_event_score_human > self.global_event_score_vehicle:
-                #         self.global_event_object = "128"
-                #     else:
-                #         self.global_event_object = "256"
-                # else:
-                #     if "HUMAN" or "VEHICLE" or "ANIMAL" not in action_array:
-                #         self.global_event_object = None
-                #         self.global_event_score_human = 0
-                #         self.global_event_score_vehicle = 0
-                #     else:
-                #         self.global_event_object = "128"
-                #         self.global_event_score_human = action_array[5]
-                #         self.global_event_score_vehicle = 0
-                #         if "HUMAN" not in action_array:
-                #             self.global_event_object = "256"
-                #             self.global_event_score_human = 0
-                #             self.global_event_score_vehicle = action_array[5]
-
-                data_json = {
-                    "type": "motion",
-                    "start": action_array[0],
-                    "camera": action_array[2],
-                    "reason": self.global_event_object,
-                    "event_score_human": self.global_event_score_human,
-                    "event_score_vehicle": self.global_event_score_vehicle,
-                    "event_score_animal": self.global_event_score_animal,
-                    "isOnline": True,
-                }
-                action_json = {
-                    "modelKey": "event",
-                    "action": "add",
-                    "id": action_array[2],
-                }
-
+        else:
             self._process_event_ws_message(action_json, data_json)
-            return
 
-        raise ValueError(f"Unexpected model key: {model_key}")
+    def _build_camera_action(self, action_array):
+        """Build the camera update for an ARM or DISARM message."""
+        action_json = {
+            "modelKey": "camera",
+            "id": action_array[2],
+        }
+        return "camera", action_json, _CAMERA_ACTIONS[action_array[3]]
+
+    def _build_online_event(self, action_array):
+        """Build the event for an ONLINE or OFFLINE message."""
+        camera_id = action_array[2]
+        data_json = {
+            "type": "online",
+            "camera": camera_id,
+            "isOnline": action_array[3] == "ONLINE",
+        }
+        action_json = {
+            "modelKey": "event",
+            "action": "add",
+            "id": camera_id,
+        }
+        return "event", action_json, data_json
+
+    def _build_motion_event(self, action_array):
+        """Build the event for a TRIGGER_M or MOTION message."""
+        camera_id = action_array[2]
+        if action_array[3] == "TRIGGER_M":
+            self.global_event_object = action_array[4]
+        data_json = {
+            "type": "motion",
+            "start": action_array[0],
+            "camera": camera_id,
+            "reason": self.global_event_object,
+            "event_score_human": self.global_event_score_human,
+            "event_score_vehicle": self.global_event_score_vehicle,
+            "isMotionDetected": True,
+            "isOnline": True,
+        }
+        action_json = {
+            "modelKey": "event",
+            "action": "add",
+            "id": camera_id,
+        }
+        return "event", action_json, data_json
+
+    def _build_motion_end_event(self, action_array):
+        """Build the event for a MOTION_END message."""
+        camera_id = action_array[2]
+        self.global_event_score_human = 0
+        self.global_event_score_vehicle = 0
+        self.global_event_object = None
+        data_json = {
+            "type": "motion",
+            "end": action_array[0],
+            "camera": camera_id,
+            "isMotionDetected": False,
+            "reason": self.global_event_object,
+            "event_score_human": self.global_event_score_human,
+            "event_score_vehicle": self.global_event_score_vehicle,
+            "isOnline": True,
+        }
+        action_json = {
+            "modelKey": "event",
+            "action": "update",
+            "id": camera_id,
+        }
+        return "event", action_json, data_json
+
+    def _build_classify_event(self, action_array):
+        """Build the event for a CLASSIFY message."""
+        camera_id = action_array[2]
+        # Format: 20220828102950 69 0 CLASSIFY HUMAN 2 VEHICLE 1 ANIMAL 0
+        # The ANIMAL score requires SecuritySpy V5.5.
+        _LOGGER.debug("CLASSIFY: %s", action_array)
+        scores = dict(zip(action_array[4::2], action_array[5::2]))
+        human = int(scores.get("HUMAN", 0))
+        vehicle = int(scores.get("VEHICLE", 0))
+        animal = int(scores.get("ANIMAL", 0))
+        self.global_event_score_human = human
+        self.global_event_score_vehicle = vehicle
+        self.global_event_score_animal = animal
+
+        # Set the Event Object to the highest score
+        self.global_event_object = None
+        if human > vehicle and human > animal:
+            self.global_event_object = _REASON_HUMAN
+        elif vehicle > human and vehicle > animal:
+            self.global_event_object = _REASON_VEHICLE
+        elif animal > human and animal > vehicle:
+            self.global_event_object = _REASON_ANIMAL
+
+        data_json = {
+            "type": "motion",
+            "start": action_array[0],
+            "camera": camera_id,
+            "reason": self.global_event_object,
+            "event_score_human": self.global_event_score_human,
+            "event_score_vehicle": self.global_event_score_vehicle,
+            "event_score_animal": self.global_event_score_animal,
+            "isOnline": True,
+        }
+        action_json = {
+            "modelKey": "event",
+            "action": "add",
+            "id": camera_id,
+        }
+        return "event", action_json, data_json
 
     def _process_camera_ws_message(self, action_json, data_json):
         """Process a decoded camera websocket message."""
@@ -660,26 +825,18 @@ class SecSpyServer:
         if camera_id is None:
             return
 
-        if not processed_camera["recording_mode_m"]:
-            processed_event = camera_event_from_ws_frames(
-                self._device_state_machine, action_json, data_json
-            )
-            if processed_event is not None:
-                _LOGGER.debug("Processed camera motion event: %s", processed_event)
-                processed_camera.update(processed_event)
-        if not processed_camera["recording_mode_c"]:
-            processed_event = camera_event_from_ws_frames(
-                self._device_state_machine, action_json, data_json
-            )
-            if processed_event is not None:
-                _LOGGER.debug("Processed camera continuous event: %s", processed_event)
-                processed_camera.update(processed_event)
-        if not processed_camera["recording_mode_a"]:
+        # Action recording is the mode most often left disarmed, so test it
+        # first and let the and-chain stop after a single lookup.
+        if not (
+            processed_camera["recording_mode_a"]
+            and processed_camera["recording_mode_c"]
+            and processed_camera["recording_mode_m"]
+        ):
             processed_event = camera_event_from_ws_frames(
                 self._device_state_machine, action_json, data_json
             )
             if processed_event is not None:
-                _LOGGER.debug("Processed camera action event: %s", processed_event)
+                _LOGGER.debug("Processed camera event: %s", processed_event)
                 processed_camera.update(processed_event)
 
         self.fire_event(camera_id, processed_camera)
@@ -699,7 +856,50 @@ class SecSpyServer:
 
     def fire_event(self, device_id, processed_event):
         """Callback and event to the subscribers and update data."""
+        event_on = processed_event.get("event_on")
+        if (
+            device_id in self._pending_updates
+            and event_on is not None
+            and event_on != self._processed_data[device_id].get("event_on")
+        ):
+            # Deliver the pending state first so subscribers still see both
+            # the start and the end of a motion event.
+            self._flush_updates()
         self._update_device(device_id, processed_event)
+        # The processed data no longer matches the last poll, so the next
+        # poll has to process the camera again to correct any missed line.
+        self._camera_signatures.pop(device_id, None)
+
+        # Updates arriving in the same loop iteration, like the TRIGGER_M,
+        # CLASSIFY and FILE lines of one motion event, go out as one batch.
+        self._pending_updates[device_id] = self._processed_data[device_id]
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush_updates)
+
+    def _flush_updates(self):
+        """Send the pending device updates to the subscribers."""
+        self._flush_scheduled = False
+        if not self._pending_updates:
+            return
+        payload = self._pending_updates
+        self._pending_updates = {}
 
-        for subscriber in self._ws_subscriptions:
-            subscriber({device_id: self._processed_data[device_id]})
+        coros = []
+        # Iterate the snapshot, a subscriber may unsubscribe while it runs.
+        for subscriber in self._ws_subscribers:
+            try:
+                result = subscriber(payload)
+            except Exception as err:
+                # Keep notifying the others, this runs from call_soon and
+                # nothing upstream would handle the error.
+                _LOGGER.exception("Error in event subscriber: %s", err)
+                continue
+            if asyncio.iscoroutine(result):
+                coros.append(result)
+        if coros:
+            # Run async subscribers concurrently so none of them stalls the stream.
+            future = asyncio.gather(*coros, return_exceptions=True)
+            self._ws_tasks.add(future)
+            future.add_done_callback(self._ws_tasks.discard)
+            future.add_done_callback(_log_subscriber_errors)